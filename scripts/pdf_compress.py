@@ -6,6 +6,12 @@ Compresses PDF files by optimizing images and removing unused objects.
 
 import sys
 import os
+import io
+import tempfile
+from typing import Optional
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
 
 try:
     import fitz  # PyMuPDF
@@ -13,8 +19,93 @@ except ImportError:
     print("ERROR: PyMuPDF library not installed. Install it with: pip install PyMuPDF", file=sys.stderr)
     sys.exit(1)
 
+try:
+    # Optional: orjson for the stats line, falling back to json
+    import orjson
+    HAS_ORJSON = True
+except ImportError:
+    import json
+    HAS_ORJSON = False
+
+try:
+    # Pillow (ideally Pillow-SIMD built against libjpeg-turbo/mozjpeg) gives us
+    # Lanczos resampling and a tunable JPEG encoder
+    from PIL import Image
+    HAS_PIL = True
+except ImportError:
+    HAS_PIL = False
+
+# Save options of the "simpler compression" retry in main(): garbage collection
+# and lossless stream compression only
+SIMPLE_SAVE_OPTIONS = {
+    'garbage': 4,
+    'deflate': True,
+    'deflate_images': True,
+    'deflate_fonts': True,
+    'use_objstms': True,
+    'clean': True,
+    'ascii': False,
+}
+
+
+def get_save_options(compression_level: str) -> dict:
+    """Return the doc.save() options compress_pdf() uses for a compression level."""
+    # Aggressive compression options
+    # Use maximum garbage collection and compression
+    save_options = {
+        'garbage': 4,        # Maximum garbage collection (remove all unused objects)
+        'deflate': True,     # Use deflate compression for streams
+        'deflate_images': True,  # Losslessly compress uncompressed image streams
+        'deflate_fonts': True,   # Losslessly compress uncompressed font files
+        'use_objstms': True,     # Pack small objects into compressed object streams
+        'clean': True,       # Clean and sanitize content streams
+        'ascii': False,      # Keep binary (smaller)
+    }
+    
+    # Adjust based on compression level
+    if compression_level.lower() == 'low':
+        save_options['garbage'] = 4  # Most aggressive
+    elif compression_level.lower() == 'high':
+        save_options['garbage'] = 3  # Less aggressive but still good
+    
+    return save_options
+
 
-def compress_pdf(input_path: str, output_path: str, compression_level: str = 'medium') -> bool:
+def pixmap_to_image(pix):
+    """Wrap an alpha-free grayscale or RGB pixmap's samples in a PIL image."""
+    mode = "L" if pix.n == 1 else "RGB"
+    return Image.frombytes(mode, (pix.width, pix.height), pix.samples)
+
+
+def encode_jpeg(img, width: int, height: int, quality: int) -> bytes:
+    """
+    Resize an image with Pillow and encode it as an optimized progressive JPEG.
+    
+    Pillow releases the GIL while resampling and encoding, so this is safe and
+    worthwhile to run from worker threads on separate images.
+    
+    Args:
+        img: Source PIL image (mode "L" or "RGB")
+        width: Target width in pixels
+        height: Target height in pixels
+        quality: JPEG quality (1-95)
+        
+    Returns:
+        Encoded JPEG bytes
+    """
+    img = img.resize((width, height), Image.Resampling.LANCZOS)
+    
+    save_options = {'format': 'JPEG', 'quality': quality, 'optimize': True, 'progressive': True}
+    if img.mode == "RGB":
+        # 4:2:0 chroma subsampling at lower qualities, full chroma otherwise
+        save_options['subsampling'] = 2 if quality < 80 else 0
+    
+    buf = io.BytesIO()
+    img.save(buf, **save_options)
+    return buf.getvalue()
+
+
+def compress_pdf(input_path: str, output_path: str, compression_level: str = 'medium') -> Optional[int]:
     """
     Compress PDF using PyMuPDF with aggressive optimization.
     
@@ -24,7 +115,7 @@ def compress_pdf(input_path: str, output_path: str, compression_level: str = 'me
         compression_level: 'low', 'medium', or 'high'
         
     Returns:
-        True if compression successful, False otherwise
+        Number of images that were re-encoded if compression succeeded, None otherwise
     """
     try:
         # Map compression level to image quality and DPI
@@ -44,94 +135,150 @@ def compress_pdf(input_path: str, output_path: str, compression_level: str = 'me
         # Process images more aggressively to reduce size
         images_processed = 0
         try:
+            # First pass: find every image xref once, with the page where it is
+            # rendered largest. Shared images (logos, letterheads) are then
+            # processed a single time, and a small thumbnail use on one page
+            # does not skew the DPI estimate.
+            image_contexts = {}  # xref -> (page_num, displayed width in points, pixel width, pixel height, colorspace)
             for page_num in range(len(doc)):
                 page = doc[page_num]
-                image_list = page.get_images()
+                page_width = page.rect.width
+                
+                displayed_widths = {}
+                for info in page.get_image_info(xrefs=True):
+                    width = fitz.Rect(info["bbox"]).width
+                    if info["xref"] and width > displayed_widths.get(info["xref"], 0):
+                        displayed_widths[info["xref"]] = width
                 
-                for img_index, img in enumerate(image_list):
+                for img in page.get_images():
+                    xref = img[0]
+                    # img[1] is the xref of the image's soft mask (/SMask). Replacing
+                    # the image with a plain JPEG would drop it and turn the
+                    # transparent parts black, so masked images are left alone
+                    if img[1]:
+                        continue
+                    # Images we cannot locate on the page are assumed to span its width
+                    width = displayed_widths.get(xref, page_width)
+                    if xref not in image_contexts or width > image_contexts[xref][1]:
+                        # img[2], img[3] and img[5] are the image's pixel dimensions and
+                        # colorspace name, read from its dictionary without decoding it
+                        image_contexts[xref] = (page_num, width, img[2], img[3], img[5])
+            
+            # Decide for all images at once which ones to downscale and to what size
+            xrefs = list(image_contexts)
+            contexts = list(image_contexts.values())
+            display_widths = np.array([c[1] for c in contexts], dtype=np.float64)
+            pixel_widths = np.array([c[2] for c in contexts], dtype=np.float64)
+            pixel_heights = np.array([c[3] for c in contexts], dtype=np.float64)
+            
+            # Estimate DPI from the image's pixel width vs. its largest displayed width
+            display_width_inches = display_widths / 72.0  # Convert points to inches
+            estimated_dpi = np.full_like(pixel_widths, 300.0)
+            np.divide(pixel_widths, display_width_inches, out=estimated_dpi, where=display_width_inches > 0)
+            
+            scale_factors = target_dpi / np.maximum(estimated_dpi, 72)  # Don't upscale
+            # Skip CMYK up front so those images are never decoded
+            is_cmyk = np.array([c[4] == 'DeviceCMYK' for c in contexts], dtype=bool)
+            # Only process if we can reduce size by at least 5%
+            to_downscale = np.flatnonzero((scale_factors < 0.95) & ~is_cmyk)
+            new_widths = np.maximum(1, (pixel_widths * scale_factors).astype(np.int64))
+            new_heights = np.maximum(1, (pixel_heights * scale_factors).astype(np.int64))
+            
+            # Second pass (main thread): decode only the images being downscaled.
+            # PyMuPDF documents are not thread-safe, so all decoding and
+            # replace_image() calls stay on this thread; only the Pillow resize +
+            # JPEG encode work is handed to the thread pool.
+            max_workers = os.cpu_count() or 1
+            batch_size = max_workers * 2  # Bounds how many decoded images are held at once
+            jobs = []  # (xref, page_num, PIL image, new_width, new_height, original_size)
+            
+            def replace_if_smaller(xref, page_num, img_data, original_size):
+                nonlocal images_processed
+                if len(img_data) < original_size * 0.9:  # Only if 10% smaller
+                    doc[page_num].replace_image(xref, stream=img_data)
+                    images_processed += 1
+            
+            def encode_job(job):
+                xref, page_num, img, new_width, new_height, original_size = job
+                try:
+                    return encode_jpeg(img, new_width, new_height, jpeg_quality)
+                except Exception as e:
+                    print(f"Warning: Skipping image xref {xref} on page {page_num + 1}: {e}", file=sys.stderr)
+                    return None
+            
+            def flush_jobs(executor):
+                for job, img_data in zip(jobs, executor.map(encode_job, jobs)):
+                    if img_data is None:
+                        continue
+                    xref, page_num, _, _, _, original_size = job
+                    try:
+                        replace_if_smaller(xref, page_num, img_data, original_size)
+                    except Exception as e:
+                        print(f"Warning: Skipping image xref {xref} on page {page_num + 1}: {e}", file=sys.stderr)
+                jobs.clear()
+            
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                for i in to_downscale.tolist():
+                    xref = xrefs[i]
+                    page_num = contexts[i][0]
+                    new_width = int(new_widths[i])
+                    new_height = int(new_heights[i])
                     try:
-                        xref = img[0]
                         pix = fitz.Pixmap(doc, xref)
                         
-                        # Skip if already small or CMYK
+                        # Catch CMYK behind ICC or indexed colorspaces the metadata check missed
                         if pix.n >= 4:  # CMYK or more channels
                             pix = None
                             continue
                         
-                        # Calculate if we should downscale
-                        # Estimate DPI: assume standard page size, calculate from image size vs page size
-                        page_rect = page.rect
-                        page_width_inches = page_rect.width / 72.0  # Convert points to inches
-                        estimated_dpi = pix.width / page_width_inches if page_width_inches > 0 else 300
-                        
-                        scale_factor = target_dpi / max(estimated_dpi, 72)  # Don't upscale
+                        # Baseline is the size of the stream as stored in the file; reading it
+                        # is free, unlike re-encoding the full-size image just to measure it
+                        try:
+                            original_size = len(doc.xref_stream_raw(xref))
+                        except Exception:
+                            original_size = pix.width * pix.height * pix.n  # Uncompressed upper bound
                         
-                        # Only process if we can reduce size
-                        if scale_factor < 0.95:  # Only if reducing by at least 5%
-                            new_width = max(1, int(pix.width * scale_factor))
-                            new_height = max(1, int(pix.height * scale_factor))
-                            
-                            # Create resized pixmap
+                        # Convert to JPEG with quality setting for better compression
+                        if pix.alpha == 0 and HAS_PIL:
+                            # No transparency: resize and encode with Pillow on the pool
+                            jobs.append((xref, page_num, pixmap_to_image(pix), new_width, new_height, original_size))
+                            if len(jobs) >= batch_size:
+                                flush_jobs(executor)
+                        else:
                             resized_pix = fitz.Pixmap(pix, new_width, new_height)
-                            
-                            # Convert to JPEG with quality setting for better compression
-                            if pix.alpha == 0:  # No transparency
-                                # Use JPEG with specified quality
-                                # PyMuPDF doesn't support quality parameter directly, but we can use tobytes
-                                # For better compression, we'll use lower quality JPEG
+                            if pix.alpha == 0:
+                                # No Pillow: PyMuPDF's encoder has no quality tuning
                                 img_data = resized_pix.tobytes("jpeg")
-                                
-                                # If the JPEG is larger than original, skip replacement
-                                original_size = len(pix.tobytes("png")) if pix.alpha > 0 else len(pix.tobytes("jpeg"))
-                                if len(img_data) < original_size * 0.9:  # Only if 10% smaller
-                                    doc.replace_image(xref, imgbytes=img_data)
-                                    images_processed += 1
                             else:
                                 # Has transparency, keep as PNG but resize
                                 img_data = resized_pix.tobytes("png")
-                                original_size = len(pix.tobytes("png"))
-                                if len(img_data) < original_size * 0.9:  # Only if 10% smaller
-                                    doc.replace_image(xref, imgbytes=img_data)
-                                    images_processed += 1
-                            
+                            # If the result is larger than original, skip replacement
+                            replace_if_smaller(xref, page_num, img_data, original_size)
                             resized_pix = None
                         
                         pix = None
                         
                     except Exception as e:
                         # Skip problematic images
-                        print(f"Warning: Skipping image {img_index} on page {page_num + 1}: {e}", file=sys.stderr)
+                        print(f"Warning: Skipping image xref {xref} on page {page_num + 1}: {e}", file=sys.stderr)
                         continue
+                
+                flush_jobs(executor)
         except Exception as e:
             # Continue even if image processing fails
             print(f"Warning: Image processing error: {e}", file=sys.stderr)
         
-        # Aggressive compression options
-        # Use maximum garbage collection and compression
-        save_options = {
-            'garbage': 4,        # Maximum garbage collection (remove all unused objects)
-            'deflate': True,     # Use deflate compression for streams
-            'clean': True,       # Clean and sanitize content streams
-            'ascii': False,      # Keep binary (smaller)
-        }
-        
-        # Adjust based on compression level
-        if compression_level.lower() == 'low':
-            save_options['garbage'] = 4  # Most aggressive
-        elif compression_level.lower() == 'high':
-            save_options['garbage'] = 3  # Less aggressive but still good
-        
         # Save the compressed PDF
-        doc.save(output_path, **save_options)
+        doc.save(output_path, **get_save_options(compression_level))
         doc.close()
         
-        return True
+        return images_processed
         
     except Exception as e:
         print(f"ERROR: Failed to compress PDF: {e}", file=sys.stderr)
         import traceback
         traceback.print_exc(file=sys.stderr)
-        return False
+        return None
 
 
 def main():
@@ -157,47 +304,60 @@ def main():
     
     # Compress the PDF
     try:
-        success = compress_pdf(input_path, output_path, compression_level)
+        images_processed = compress_pdf(input_path, output_path, compression_level)
         
-        if not success:
-            print("ERROR: Compression function returned False", file=sys.stderr)
+        if images_processed is None:
+            print("ERROR: Compression function failed", file=sys.stderr)
             sys.exit(1)
         
-        # Verify output file was created
-        if not os.path.exists(output_path):
+        # Verify output file was created; its size is reused for the statistics
+        try:
+            compressed_size = os.path.getsize(output_path)
+        except OSError:
             print(f"ERROR: Output file was not created: {output_path}", file=sys.stderr)
             sys.exit(1)
         
         # Verify output file is not empty
-        if os.path.getsize(output_path) == 0:
+        if compressed_size == 0:
             print("ERROR: Output file is empty", file=sys.stderr)
             sys.exit(1)
         
         # Get file sizes for statistics
         original_size = os.path.getsize(input_path)
-        compressed_size = os.path.getsize(output_path)
-        compression_ratio = ((1 - compressed_size / original_size) * 100) if original_size > 0 else 0
         
-        # If compression made file larger, try a simpler approach
-        if compressed_size >= original_size:
+        # If compression made file larger, try a simpler approach. When no image
+        # was re-encoded and the save used the same options as the retry, the
+        # first pass already produced exactly what the retry would, so skip it.
+        retry_is_same = (images_processed == 0 and
+                         get_save_options(compression_level) == SIMPLE_SAVE_OPTIONS)
+        if compressed_size >= original_size and not retry_is_same:
             print(f"Warning: Initial compression increased size ({compressed_size} vs {original_size}). Trying simpler compression...", file=sys.stderr)
             
-            # Try again with just garbage collection and deflate, no image processing
+            # Try again with just garbage collection and deflate, no image processing.
+            # Write next to the output and swap it in only if it is smaller.
+            tmp_path = None
             try:
+                fd, tmp_path = tempfile.mkstemp(suffix='.pdf', dir=os.path.dirname(os.path.abspath(output_path)))
+                os.close(fd)
+                
                 doc = fitz.open(input_path)
-                doc.save(output_path, garbage=4, deflate=True, clean=True, ascii=False)
+                doc.save(tmp_path, **SIMPLE_SAVE_OPTIONS)
                 doc.close()
                 
-                new_size = os.path.getsize(output_path)
+                new_size = os.path.getsize(tmp_path)
                 if new_size < compressed_size:
+                    os.replace(tmp_path, output_path)
+                    tmp_path = None
                     compressed_size = new_size
-                    compression_ratio = ((1 - compressed_size / original_size) * 100) if original_size > 0 else 0
                     print("Simpler compression produced better results", file=sys.stderr)
             except Exception as e:
                 print(f"Warning: Simpler compression also failed: {e}", file=sys.stderr)
+            finally:
+                if tmp_path and os.path.exists(tmp_path):
+                    os.remove(tmp_path)
         
         # Output statistics as JSON for the API to parse
-        import json
+        compression_ratio = ((1 - compressed_size / original_size) * 100) if original_size > 0 else 0
         stats = {
             'success': True,
             'original_size': original_size,
@@ -205,7 +365,11 @@ def main():
             'compression_ratio': round(compression_ratio, 1),
             'size_reduction': round((original_size - compressed_size) / 1024, 1)
         }
-        print(json.dumps(stats))
+        if HAS_ORJSON:
+            sys.stdout.buffer.write(orjson.dumps(stats) + b"\n")
+            sys.stdout.buffer.flush()
+        else:
+            print(json.dumps(stats))
         sys.exit(0)
     except Exception as e:
         print(f"ERROR: Unexpected error during compression: {e}", file=sys.stderr)
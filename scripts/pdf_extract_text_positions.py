@@ -5,8 +5,106 @@ Returns JSON with text positions in canvas coordinate system (top-left origin).
 """
 
 import sys
+import os
+import gc
 import json
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from itertools import repeat
 import fitz  # PyMuPDF
+import numpy as np
+
+try:
+    # Optional: orjson serializes large item lists several times faster than json
+    import orjson
+    HAS_ORJSON = True
+except ImportError:
+    HAS_ORJSON = False
+
+# Two-digit hex strings for every channel value, indexed by the channel itself
+HEX = np.array([f"{i:02x}" for i in range(256)])
+
+# "dict" extraction without image blocks, as in pdf_replace_text.py
+TEXT_FLAGS = fitz.TEXTFLAGS_DICT & ~fitz.TEXT_PRESERVE_IMAGES
+
+# Page extraction is spread over worker processes for larger documents;
+# small ones are not worth the process start-up cost
+PARALLEL_MIN_PAGES = 4
+PAGES_PER_TASK = 4
+MAX_WORKERS = 4
+
+
+def _extract_page_records(pdf_path, page_nums):
+    """
+    Collect one raw tuple per text span for the given pages.
+
+    Runs inside worker processes, so it opens its own document.
+    """
+    doc = fitz.open(pdf_path)
+    records = []
+    append = records.append
+    
+    # The dict trees and span tuples built here are acyclic and freed by
+    # reference counting, so the cyclic collector's passes over them
+    # (triggered by sheer allocation count) are pure overhead
+    gc_was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        for page_num in page_nums:
+            page = doc[page_num]
+            page_height = page.rect.height
+            page_no = page_num + 1
+        
+            # Get text blocks with bounding boxes
+            blocks = page.get_text("dict", flags=TEXT_FLAGS)["blocks"]
+        
+            for block in blocks:
+                if "lines" not in block:
+                    continue
+                
+                for line in block["lines"]:
+                    for span in line["spans"]:
+                        text = span["text"]
+                        if not text or text.isspace():
+                            continue
+                    
+                        color = span.get("color", 0)
+                        append((
+                            text.strip(),
+                            # Bounding box [x0, y0, x1, y1] in PDF coordinates
+                            span["bbox"],
+                            page_height,
+                            page_no,
+                            span.get("size", 12),
+                            span.get("font", "helv"),
+                            # Non-integer colors fall back to black
+                            color if isinstance(color, int) else 0,
+                        ))
+    finally:
+        if gc_was_enabled:
+            gc.enable()
+        doc.close()
+
+    return records
+
+
+def _collect_records(pdf_path, page_count):
+    """Collect span records for every page, spreading pages over worker processes."""
+    max_workers = min(os.cpu_count() or 1, MAX_WORKERS)
+    if page_count <= PARALLEL_MIN_PAGES or max_workers <= 1:
+        return _extract_page_records(pdf_path, range(page_count))
+
+    chunks = [range(start, min(start + PAGES_PER_TASK, page_count))
+              for start in range(0, page_count, PAGES_PER_TASK)]
+    try:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            chunk_records = list(executor.map(_extract_page_records, repeat(pdf_path), chunks))
+    except BrokenProcessPool:
+        return _extract_page_records(pdf_path, range(page_count))
+
+    # executor.map preserves submission order, so pages stay in document order
+    return [record for records in chunk_records for record in records]
+
 
 def extract_text_positions(pdf_path, scale=2.0):
     """
@@ -20,67 +118,58 @@ def extract_text_positions(pdf_path, scale=2.0):
         List of text items with positions
     """
     doc = fitz.open(pdf_path)
-    text_items = []
-    
-    for page_num in range(len(doc)):
-        page = doc[page_num]
-        page_height = page.rect.height
-        
-        # Get text blocks with bounding boxes
-        blocks = page.get_text("dict")
-        
-        for block in blocks.get("blocks", []):
-            if "lines" not in block:
-                continue
-                
-            for line in block["lines"]:
-                for span in line["spans"]:
-                    text = span.get("text", "").strip()
-                    if not text:
-                        continue
-                    
-                    # Get bounding box (PyMuPDF uses bottom-left origin)
-                    bbox = span["bbox"]  # [x0, y0, x1, y1] in PDF coordinates
-                    x0, y0, x1, y1 = bbox
-                    
-                    # Convert to canvas coordinate system (top-left origin)
-                    # PyMuPDF: y0 is bottom, y1 is top (inverted from what we expect)
-                    # Canvas: top-left is (0,0), y increases downward
-                    width = (x1 - x0) * scale
-                    height = (y1 - y0) * scale
-                    x = x0 * scale
-                    # Convert Y: page_height - y1 gives us top in canvas coordinates
-                    y = (page_height - y1) * scale
-                    
-                    # Get font properties
-                    font_size = span.get("size", 12) * scale
-                    font_name = span.get("font", "helv")
-                    color = span.get("color", 0)
-                    
-                    # Convert color from int to hex
-                    if isinstance(color, int):
-                        # Color is stored as 0xRRGGBB
-                        r = (color >> 16) & 0xFF
-                        g = (color >> 8) & 0xFF
-                        b = color & 0xFF
-                        color_hex = f"#{r:02x}{g:02x}{b:02x}"
-                    else:
-                        color_hex = "#000000"
-                    
-                    text_items.append({
-                        "text": text,
-                        "x": round(x, 2),
-                        "y": round(y, 2),
-                        "width": round(width, 2),
-                        "height": round(height, 2),
-                        "pageNum": page_num + 1,
-                        "fontSize": round(font_size, 2),
-                        "fontName": font_name,
-                        "color": color_hex,
-                    })
-    
+    page_count = len(doc)
     doc.close()
-    return text_items
+
+    # First pass: collect one raw tuple per span; all arithmetic is done afterwards in bulk
+    records = _collect_records(pdf_path, page_count)
+
+    if not records:
+        return []
+
+    texts, bboxes, page_heights, pages, sizes, fonts, colors = zip(*records)
+
+    # Convert to canvas coordinate system (top-left origin)
+    # PyMuPDF: y0 is bottom, y1 is top (inverted from what we expect)
+    # Canvas: top-left is (0,0), y increases downward
+    bbox_arr = np.asarray(bboxes, dtype=np.float64)
+    x0, y0, x1, y1 = bbox_arr[:, 0], bbox_arr[:, 1], bbox_arr[:, 2], bbox_arr[:, 3]
+    xs = np.round(x0 * scale, 2).tolist()
+    # Convert Y: page_height - y1 gives us top in canvas coordinates
+    ys = np.round((np.asarray(page_heights, dtype=np.float64) - y1) * scale, 2).tolist()
+    widths = np.round((x1 - x0) * scale, 2).tolist()
+    heights = np.round((y1 - y0) * scale, 2).tolist()
+    font_sizes = np.round(np.asarray(sizes, dtype=np.float64) * scale, 2).tolist()
+
+    # Convert color from int (0xRRGGBB) to hex
+    color_arr = np.asarray(colors, dtype=np.uint32)
+    r = (color_arr >> 16) & 0xFF
+    g = (color_arr >> 8) & 0xFF
+    b = color_arr & 0xFF
+    color_hex = np.char.add(np.char.add(np.char.add("#", HEX[r]), HEX[g]), HEX[b]).tolist()
+
+    return [
+        {
+            "text": texts[i],
+            "x": xs[i],
+            "y": ys[i],
+            "width": widths[i],
+            "height": heights[i],
+            "pageNum": pages[i],
+            "fontSize": font_sizes[i],
+            "fontName": fonts[i],
+            "color": color_hex[i],
+        }
+        for i in range(len(texts))
+    ]
+
+def write_json(obj):
+    """Write obj to stdout as a single line of JSON."""
+    if HAS_ORJSON:
+        sys.stdout.buffer.write(orjson.dumps(obj) + b"\n")
+        sys.stdout.buffer.flush()
+    else:
+        print(json.dumps(obj))
 
 if __name__ == "__main__":
     if len(sys.argv) < 2:
@@ -96,7 +185,7 @@ if __name__ == "__main__":
             "success": True,
             "textItems": text_items
         }
-        print(json.dumps(result))
+        write_json(result)
     except Exception as e:
         print(json.dumps({"error": str(e)}))
         sys.exit(1)
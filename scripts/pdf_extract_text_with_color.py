@@ -5,74 +5,153 @@ Returns JSON with text items including their positions, fonts, and colors.
 """
 
 import sys
+import os
+import gc
 import json
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from itertools import repeat
 import fitz  # PyMuPDF
+import numpy as np
 
-def extract_text_with_color(pdf_path):
-    """Extract text from PDF with color, position, and font information."""
+try:
+    # Optional: orjson serializes large item lists several times faster than json
+    import orjson
+    HAS_ORJSON = True
+except ImportError:
+    HAS_ORJSON = False
+
+# "dict" extraction without image blocks, as in pdf_replace_text.py
+TEXT_FLAGS = fitz.TEXTFLAGS_DICT & ~fitz.TEXT_PRESERVE_IMAGES
+
+# Page extraction is spread over worker processes for larger documents;
+# small ones are not worth the process start-up cost
+PARALLEL_MIN_PAGES = 4
+PAGES_PER_TASK = 4
+MAX_WORKERS = 4
+
+def _extract_page_records(pdf_path, page_nums):
+    """
+    Collect one raw tuple per text span for the given pages.
+
+    Runs inside worker processes, so it opens its own document.
+    """
     doc = fitz.open(pdf_path)
-    all_text_items = []
+    records = []
+    append = records.append
     
-    for page_num in range(len(doc)):
-        page = doc[page_num]
+    # The dict trees and span tuples built here are acyclic and freed by
+    # reference counting, so the cyclic collector's passes over them
+    # (triggered by sheer allocation count) are pure overhead
+    gc_was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        for page_num in page_nums:
+            page = doc[page_num]
+            page_height = page.rect.height
+            page_no = page_num + 1  # 1-indexed
         
-        # Get text blocks with detailed information
-        text_dict = page.get_text("dict")
+            # Get text blocks with detailed information
+            blocks = page.get_text("dict", flags=TEXT_FLAGS)["blocks"]
         
-        # Process each block
-        for block in text_dict.get("blocks", []):
-            if "lines" not in block:
-                continue
+            # Process each block
+            for block in blocks:
+                if "lines" not in block:
+                    continue
                 
-            for line in block.get("lines", []):
-                for span in line.get("spans", []):
-                    text = span.get("text", "").strip()
-                    if not text:
-                        continue
-                    
-                    # Extract color information
-                    color = span.get("color", 0)  # Default to 0 (black)
-                    
-                    # Convert color from integer to RGB
-                    # PyMuPDF stores color as 24-bit integer: 0xRRGGBB
-                    r = (color >> 16) & 0xFF
-                    g = (color >> 8) & 0xFF
-                    b = color & 0xFF
+                for line in block["lines"]:
+                    for span in line["spans"]:
+                        text = span["text"]
+                        if not text or text.isspace():
+                            continue
                     
-                    # Normalize to 0-1 range for consistency
-                    rgb_normalized = [r / 255.0, g / 255.0, b / 255.0]
-                    
-                    # Get font information
-                    font_name = span.get("font", "Arial")
-                    font_size = span.get("size", 12)
-                    
-                    # Get position and dimensions
-                    # PyMuPDF bbox: [x0, y0, x1, y1] where y0 is bottom, y1 is top
-                    bbox = span.get("bbox", [0, 0, 0, 0])
-                    page_height = page.rect.height
-                    
-                    x = bbox[0]
-                    # Convert Y from bottom-left origin to top-left origin (canvas coordinates)
-                    y = page_height - bbox[3]  # Use bbox[3] (top) and invert
-                    width = bbox[2] - bbox[0]
-                    height = bbox[3] - bbox[1]
-                    
-                    text_item = {
-                        "text": text,
-                        "x": x,
-                        "y": y,
-                        "width": width,
-                        "height": height,
-                        "fontSize": font_size,
-                        "fontName": font_name,
-                        "color": rgb_normalized,  # [r, g, b] in 0-1 range
-                        "pageNum": page_num + 1,  # 1-indexed
-                    }
-                    
-                    all_text_items.append(text_item)
-    
+                        append((
+                            text.strip(),
+                            # PyMuPDF bbox: [x0, y0, x1, y1] where y0 is bottom, y1 is top
+                            span["bbox"],
+                            page_height,
+                            page_no,
+                            span.get("font", "Arial"),
+                            span.get("size", 12),
+                            span.get("color", 0),  # Default to 0 (black)
+                        ))
+    finally:
+        if gc_was_enabled:
+            gc.enable()
+        doc.close()
+
+    return records
+
+
+def _collect_records(pdf_path, page_count):
+    """Collect span records for every page, spreading pages over worker processes."""
+    max_workers = min(os.cpu_count() or 1, MAX_WORKERS)
+    if page_count <= PARALLEL_MIN_PAGES or max_workers <= 1:
+        return _extract_page_records(pdf_path, range(page_count))
+
+    chunks = [range(start, min(start + PAGES_PER_TASK, page_count))
+              for start in range(0, page_count, PAGES_PER_TASK)]
+    try:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            chunk_records = list(executor.map(_extract_page_records, repeat(pdf_path), chunks))
+    except BrokenProcessPool:
+        return _extract_page_records(pdf_path, range(page_count))
+
+    # executor.map preserves submission order, so pages stay in document order
+    return [record for records in chunk_records for record in records]
+
+
+def extract_text_with_color(pdf_path):
+    """Extract text from PDF with color, position, and font information."""
+    doc = fitz.open(pdf_path)
+    page_count = len(doc)
     doc.close()
-    return all_text_items
+
+    # First pass: collect one raw tuple per span; all arithmetic is done afterwards in bulk
+    records = _collect_records(pdf_path, page_count)
+
+    if not records:
+        return []
+
+    texts, bboxes, page_heights, pages, fonts, sizes, colors = zip(*records)
+
+    # Get position and dimensions
+    bbox_arr = np.asarray(bboxes, dtype=np.float64)
+    xs = bbox_arr[:, 0].tolist()
+    # Convert Y from bottom-left origin to top-left origin (canvas coordinates)
+    ys = (np.asarray(page_heights, dtype=np.float64) - bbox_arr[:, 3]).tolist()
+    widths = (bbox_arr[:, 2] - bbox_arr[:, 0]).tolist()
+    heights = (bbox_arr[:, 3] - bbox_arr[:, 1]).tolist()
+
+    # Convert color from integer to RGB
+    # PyMuPDF stores color as 24-bit integer: 0xRRGGBB
+    color_arr = np.asarray(colors, dtype=np.uint32)
+    rgb = np.stack(((color_arr >> 16) & 0xFF, (color_arr >> 8) & 0xFF, color_arr & 0xFF), axis=1)
+    # Normalize to 0-1 range for consistency
+    rgb_normalized = (rgb / 255.0).tolist()
+
+    return [
+        {
+            "text": texts[i],
+            "x": xs[i],
+            "y": ys[i],
+            "width": widths[i],
+            "height": heights[i],
+            "fontSize": sizes[i],
+            "fontName": fonts[i],
+            "color": rgb_normalized[i],  # [r, g, b] in 0-1 range
+            "pageNum": pages[i],
+        }
+        for i in range(len(texts))
+    ]
+
+def write_json(obj):
+    """Write obj to stdout as a single line of JSON."""
+    if HAS_ORJSON:
+        sys.stdout.buffer.write(orjson.dumps(obj) + b"\n")
+        sys.stdout.buffer.flush()
+    else:
+        print(json.dumps(obj))
 
 def main():
     if len(sys.argv) < 2:
@@ -88,7 +167,7 @@ def main():
             "textItems": text_items,
             "count": len(text_items)
         }
-        print(json.dumps(result))
+        write_json(result)
     except Exception as e:
         error_result = {
             "success": False,
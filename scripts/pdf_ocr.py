@@ -6,9 +6,11 @@ Converts scanned PDFs (image-based) to searchable PDFs with text layers.
 
 import sys
 import os
-import io
+import shutil
 import tempfile
 from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 
 try:
     import fitz  # PyMuPDF
@@ -23,6 +25,198 @@ except ImportError:
     print("ERROR: Required OCR libraries not installed. Install with: pip install pytesseract pillow", file=sys.stderr)
     sys.exit(1)
 
+try:
+    # Optional: tesserocr keeps the Tesseract engine loaded in-process instead of
+    # spawning a tesseract subprocess (and reloading the model) for every page
+    from tesserocr import PyTessBaseAPI, PSM, OEM
+    HAS_TESSEROCR = True
+except ImportError:
+    HAS_TESSEROCR = False
+
+
+# Upper bound on OCR worker processes; Tesseract is CPU-bound so more workers
+# than this mostly compete for memory bandwidth.
+MAX_OCR_WORKERS = 8
+
+# Pages are rendered so their height lands around this many pixels, the range
+# Tesseract is tuned for (~280 DPI on Letter/A4), within these zoom bounds
+TARGET_RENDER_HEIGHT = 2200
+MIN_ZOOM = 1.0
+MAX_ZOOM = 4.0
+
+# Tesseract accuracy plateaus around 200 DPI, so pages whose scanned image is
+# no sharper than that are rendered at a lower zoom
+LOW_RES_SOURCE_DPI = 200
+LOW_RES_ZOOM = 2.0
+
+# The merge loop empties MuPDF's resource store every this many pages
+STORE_SHRINK_INTERVAL = 10
+
+# Per-process tesserocr handle, created once by _init_ocr_worker()
+_TESS_API = None
+# Per-process output base for tesserocr's PDF renderer, reused for every page
+_TESS_OUTPUT_BASE = None
+# Per-process handle on the input PDF, opened once by _init_ocr_worker()
+_WORKER_DOC = None
+
+
+def _init_ocr_worker(language: str, work_dir: str = None, pdf_path: str = None):
+    """Open the input PDF and load the Tesseract model once for this process."""
+    global _TESS_API, _TESS_OUTPUT_BASE, _WORKER_DOC
+    if pdf_path and _WORKER_DOC is None:
+        # Parse the xref table once per worker rather than once per page
+        _WORKER_DOC = fitz.open(pdf_path)
+
+    if not HAS_TESSEROCR or _TESS_API is not None:
+        return
+
+    if work_dir:
+        # The renderer overwrites <outputbase>.pdf on each page, so one path per process will do
+        _TESS_OUTPUT_BASE = os.path.join(work_dir, f"page-{os.getpid()}")
+
+    api_kwargs = {'lang': language, 'oem': OEM.LSTM_ONLY, 'psm': PSM.SINGLE_BLOCK}
+    tessdata_prefix = os.environ.get("TESSDATA_PREFIX")
+    if tessdata_prefix:
+        api_kwargs['path'] = tessdata_prefix
+
+    try:
+        api = PyTessBaseAPI(**api_kwargs)
+        api.SetVariable("tessedit_create_pdf", "1")
+        _TESS_API = api
+    except Exception as init_error:
+        print(f"WARNING: tesserocr initialisation failed, using pytesseract: {init_error}", file=sys.stderr)
+        _TESS_API = None
+
+
+def _close_ocr_worker():
+    """Release the per-process input PDF and tesserocr handle, if any."""
+    global _TESS_API, _TESS_OUTPUT_BASE, _WORKER_DOC
+    if _WORKER_DOC is not None:
+        _WORKER_DOC.close()
+        _WORKER_DOC = None
+    if _TESS_API is not None:
+        _TESS_API.End()
+        _TESS_API = None
+    _TESS_OUTPUT_BASE = None
+
+
+def _render_with_tesserocr(img, outputbase: str):
+    """Run the loaded engine's PDF renderer; returns the PDF bytes or None."""
+    if _TESS_API.ProcessPage(outputbase, img, 0, "page"):
+        with open(outputbase + ".pdf", "rb") as f:
+            return f.read()
+    return None
+
+
+def _image_to_pdf(img, language: str, dpi: int) -> bytes:
+    """
+    Run OCR on a PIL image and return a single-page searchable PDF.
+
+    dpi is the image's render resolution. Raw images carry no resolution
+    metadata, and without it Tesseract guesses one and sizes the page (and
+    its text layer) against the guess.
+    """
+    if _TESS_API is not None:
+        _TESS_API.SetVariable("user_defined_dpi", str(dpi))
+        # Reuse the already-loaded engine; its PDF renderer writes <outputbase>.pdf
+        if _TESS_OUTPUT_BASE is not None:
+            pdf_bytes = _render_with_tesserocr(img, _TESS_OUTPUT_BASE)
+        else:
+            with tempfile.TemporaryDirectory() as tmp_dir:
+                pdf_bytes = _render_with_tesserocr(img, os.path.join(tmp_dir, "page"))
+        if pdf_bytes is not None:
+            return pdf_bytes
+        print("WARNING: tesserocr failed to render page, retrying with pytesseract", file=sys.stderr)
+
+    # Let Tesseract generate a PDF page with text layer and embedded image
+    return pytesseract.image_to_pdf_or_hocr(
+        img,
+        lang=language,
+        # Same engine setup as the tesserocr path: LSTM only (no legacy engine),
+        # one uniform block without orientation/script detection
+        config=f"--oem 1 --psm 6 --dpi {dpi}",
+        extension="pdf",
+    )
+
+
+def _page_has_text(page) -> bool:
+    """Return True if the page already has a (non-whitespace) text layer."""
+    # Minimal flags: no ligature/whitespace handling, we only test for emptiness
+    text = page.get_text("text", flags=fitz.TEXT_MEDIABOX_CLIP) or ""
+    return bool(text.strip())
+
+
+def _choose_zoom(page) -> float:
+    """Return the render zoom for a page, lowered for low-resolution scans."""
+    # Scale by page size rather than a fixed factor, so large-format pages are
+    # not rendered to huge images and small ones still get enough pixels
+    page_height = page.rect.height
+    zoom = TARGET_RENDER_HEIGHT / page_height if page_height > 0 else MAX_ZOOM
+    zoom = max(MIN_ZOOM, min(MAX_ZOOM, zoom))
+
+    try:
+        source_dpi = 0
+        for info in page.get_image_info():
+            shown_width_inches = fitz.Rect(info["bbox"]).width / 72.0
+            if shown_width_inches > 0:
+                source_dpi = max(source_dpi, info["width"] / shown_width_inches)
+    except Exception:
+        return zoom
+
+    if 0 < source_dpi <= LOW_RES_SOURCE_DPI:
+        return min(zoom, LOW_RES_ZOOM)
+    return zoom
+
+
+def _ocr_one_page(pdf_path: str, page_num: int, language: str):
+    """
+    Render a single page and run Tesseract on it.
+
+    PyMuPDF documents cannot be shared across processes, so each worker
+    renders from its own copy opened by _init_ocr_worker(); without one the
+    document is opened for this call only.
+
+    Returns:
+        (page_num, pdf_bytes) where pdf_bytes is a single-page searchable PDF,
+        or None if OCR failed for this page.
+    """
+    own_doc = _WORKER_DOC is None
+    doc = fitz.open(pdf_path) if own_doc else _WORKER_DOC
+    try:
+        page = doc[page_num]
+
+        # Render page to a grayscale image for OCR; Tesseract binarizes
+        # internally, so colour only adds bytes to move around
+        page_zoom = _choose_zoom(page)
+        mat = fitz.Matrix(page_zoom, page_zoom)
+        pix = page.get_pixmap(matrix=mat, colorspace=fitz.csGRAY, alpha=False)
+
+        # Copy the raw grayscale samples straight into PIL; no PNG encode/decode
+        # round-trip, and samples_mv avoids the extra bytes copy pix.samples makes
+        img = Image.frombytes("L", (pix.width, pix.height), pix.samples_mv)
+        # The PNG round-trip used to carry the resolution; set it on the image too
+        dpi = round(72 * page_zoom)
+        img.info["dpi"] = (dpi, dpi)
+        # PIL holds its own copy now, so release the pixmap before the slow OCR step
+        pix = None
+
+        try:
+            pdf_bytes = _image_to_pdf(img, language, dpi)
+        except Exception as ocr_error:
+            print(f"WARNING: OCR failed on page {page_num + 1}: {str(ocr_error)}", file=sys.stderr)
+            return page_num, None
+        finally:
+            img.close()
+
+        return page_num, pdf_bytes
+    finally:
+        page = None
+        if own_doc:
+            doc.close()
+        # Scanned pages each carry their own large image, so little in the store
+        # is reused by the next page; free it rather than let a long-lived worker grow
+        fitz.TOOLS.store_shrink(100)
+
 
 def perform_ocr_on_pdf(pdf_path: str, output_path: str, language: str = 'eng') -> bool:
     """
@@ -44,65 +238,92 @@ def perform_ocr_on_pdf(pdf_path: str, output_path: str, language: str = 'eng') -
         # Open the PDF
         doc = fitz.open(pdf_path)
 
-        # --- Fast path: if PDF already has selectable text, just copy it ---
+        # --- Decide per page whether a text layer already exists ---
+        text_pages = set()
         try:
-            has_text = False
-            for page_index in range(len(doc)):
-                page = doc[page_index]
-                text = page.get_text("text") or ""
-                if text.strip():
-                    has_text = True
-                    break
-
-            if has_text:
+            # One pass, each page extracted once with minimal flags. Mixed
+            # documents can have text on any page, so no page can be skipped
+            for page_index, page in enumerate(doc.pages()):
+                if _page_has_text(page):
+                    text_pages.add(page_index)
+
+            if len(text_pages) == len(doc):
+                # Fast path: every page already has selectable text, just copy the file
                 # Close before copying
                 doc.close()
-                # Simply copy original PDF to output; no rasterization, no OCR
-                with open(pdf_path, "rb") as src, open(output_path, "wb") as dst:
-                    dst.write(src.read())
+                # Simply copy original PDF to output; no rasterization, no OCR.
+                # copyfile lets the kernel copy the data (sendfile/copy_file_range)
+                # instead of reading the whole file into memory first
+                shutil.copyfile(pdf_path, output_path)
                 print("INFO: PDF already contains text. Skipping OCR and copying original file.", file=sys.stderr)
                 return True
         except Exception as text_check_error:
             # If text detection fails, log and continue with OCR path
             print(f"WARNING: Failed to inspect PDF text, proceeding with OCR: {text_check_error}", file=sys.stderr)
+            text_pages = set()
+
+        page_count = len(doc)
 
-        # Create output PDF
-        output_doc = fitz.open()
+        # Pages that already carry text are copied as-is; only the rest are OCR'd
+        ocr_pages = [page_num for page_num in range(page_count) if page_num not in text_pages]
+        if text_pages:
+            print(f"INFO: {len(text_pages)} of {page_count} pages already contain text; OCR'ing the remaining {len(ocr_pages)}", file=sys.stderr)
 
-        # Process each page using Tesseract's own PDF output for better text mapping
-        for page_num in range(len(doc)):
-            page = doc[page_num]
+        # OCR pages in parallel; each worker renders and recognises its own page.
+        # Single-threaded Tesseract per process scales better than OpenMP threads.
+        os.environ["OMP_THREAD_LIMIT"] = "1"
+        max_workers = max(1, min(os.cpu_count() or 1, MAX_OCR_WORKERS, len(ocr_pages)))
 
-            # Render page to high-DPI image for OCR
-            zoom = 3.0  # ~300 DPI
-            mat = fitz.Matrix(zoom, zoom)
-            pix = page.get_pixmap(matrix=mat)
+        # The output is the input document edited in place: only OCR'd pages are
+        # swapped out, so text pages are never copied and keep their shared
+        # resources, and no second document is held in memory
+        def merge_page(page_num, pdf_bytes):
+            if pdf_bytes is None:
+                # Text pages (and pages whose OCR failed) keep the original page
+                return
 
-            img_data = pix.tobytes("png")
-            img = Image.open(io.BytesIO(img_data))
+            # Open that single-page PDF and put it in place of the original page
+            ocr_page_doc = fitz.open(stream=pdf_bytes, filetype="pdf")
+            doc.insert_pdf(ocr_page_doc, start_at=page_num)
+            doc.delete_page(page_num + 1)
+            ocr_page_doc.close()
 
+        # Merge each page back in order as soon as its result is in, while the
+        # workers carry on with later pages; finished pages are not held in memory
+        merged_pages = 0
+        # Scratch space for the workers' tesserocr output, removed once OCR is done
+        with tempfile.TemporaryDirectory() as work_dir:
             try:
-                # Let Tesseract generate a PDF page with text layer and embedded image
-                pdf_bytes = pytesseract.image_to_pdf_or_hocr(
-                    img,
-                    lang=language,
-                    config="--oem 3 --psm 6",
-                    extension="pdf",
-                )
-
-                # Open that single-page PDF and append it to the output document
-                ocr_page_doc = fitz.open(stream=pdf_bytes, filetype="pdf")
-                output_doc.insert_pdf(ocr_page_doc)
-                ocr_page_doc.close()
-            except Exception as ocr_error:
-                print(f"WARNING: OCR failed on page {page_num + 1}: {str(ocr_error)}", file=sys.stderr)
-                # As a fallback, copy the original page without OCR
-                output_doc.insert_pdf(doc, from_page=page_num, to_page=page_num)
-                continue
-
-        # Save the output PDF
-        output_doc.save(output_path)
-        output_doc.close()
+                with ProcessPoolExecutor(
+                    max_workers=max_workers,
+                    initializer=_init_ocr_worker,
+                    initargs=(language, work_dir, pdf_path),
+                ) as executor:
+                    futures = {
+                        page_num: executor.submit(_ocr_one_page, pdf_path, page_num, language)
+                        for page_num in ocr_pages
+                    }
+                    for page_num in range(page_count):
+                        future = futures.pop(page_num, None)
+                        merge_page(page_num, future.result()[1] if future is not None else None)
+                        merged_pages += 1
+                        if merged_pages % STORE_SHRINK_INTERVAL == 0:
+                            fitz.TOOLS.store_shrink(100)
+            except BrokenProcessPool as pool_error:
+                print(f"WARNING: OCR worker pool failed, falling back to sequential OCR: {pool_error}", file=sys.stderr)
+                _init_ocr_worker(language, work_dir, pdf_path)
+                try:
+                    for page_num in range(merged_pages, page_count):
+                        pdf_bytes = None
+                        if page_num not in text_pages:
+                            pdf_bytes = _ocr_one_page(pdf_path, page_num, language)[1]
+                        merge_page(page_num, pdf_bytes)
+                finally:
+                    _close_ocr_worker()
+
+        # Save the output PDF; garbage collection drops the replaced scanned
+        # pages and merges the text-layer font Tesseract embeds in every page
+        doc.save(output_path, garbage=3)
         doc.close()
 
         return True
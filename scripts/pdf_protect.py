@@ -46,16 +46,20 @@ def protect_pdf(pdf_path: str, output_path: str, password: str) -> bool:
             return False
         
         # Encrypt PDF with AES-256 encryption
-        # encryption_method: 0 = no encryption, 1 = RC4 40-bit, 2 = RC4 128-bit, 3 = AES 128-bit, 4 = AES 256-bit
-        encryption_method = 4  # AES 256-bit
+        encryption_method = fitz.PDF_ENCRYPT_AES_256
         permissions = fitz.PDF_PERM_PRINT | fitz.PDF_PERM_COPY | fitz.PDF_PERM_ANNOTATE | fitz.PDF_PERM_FORM
         
+        # Only the encryption dictionary is new, so write the objects as they are:
+        # no garbage collection, content stream cleaning or recompression
         doc.save(
             output_path,
             encryption=encryption_method,
             user_pw=password,
             owner_pw=password,  # Use same password for owner
-            permissions=permissions
+            permissions=permissions,
+            garbage=0,
+            clean=False,
+            deflate=False
         )
         doc.close()
         
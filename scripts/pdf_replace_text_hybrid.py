@@ -6,8 +6,10 @@ with PyMuPDF's text control for better results.
 
 import sys
 import os
-import re
 import json
+from functools import lru_cache
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 
 try:
     import fitz  # PyMuPDF
@@ -15,10 +17,270 @@ except ImportError:
     print("ERROR: PyMuPDF library not installed. Install it with: pip install PyMuPDF", file=sys.stderr)
     sys.exit(1)
 
+# Verbose matching diagnostics are only written when PDF_REPLACE_DEBUG is set,
+# as in pdf_replace_text.py
+DEBUG = os.environ.get('PDF_REPLACE_DEBUG', '').lower() in ('1', 'true', 'yes')
+
+# "dict" extraction without image blocks, as in pdf_replace_text.py
+TEXT_FLAGS = fitz.TEXTFLAGS_DICT & ~fitz.TEXT_PRESERVE_IMAGES
+
+# Worker pool thresholds, as in pdf_replace_text.py
+PARALLEL_MIN_PAGES = 32
+MAX_REPLACE_WORKERS = 8
+
+# Fonts _insert_replacement_text() falls back to, in order; None means
+# PyMuPDF's default font
+FALLBACK_FONTS = ("helv", None)
+
+# Per-process handle on the input PDF, opened once by _init_replace_worker()
+_WORKER_DOC = None
+
+
+@lru_cache(maxsize=256)
+def color_from_int(color_int: int) -> tuple:
+    """Convert a PyMuPDF span color (0xRRGGBB) to an (r, g, b) tuple of floats."""
+    r = (color_int >> 16) & 0xFF
+    g = (color_int >> 8) & 0xFF
+    b = color_int & 0xFF
+    return (r / 255.0, g / 255.0, b / 255.0)
+
 
 def normalize_text(text):
     """Normalize text by removing all spaces for matching."""
-    return re.sub(r'\s+', '', text.strip())
+    return ''.join(text.split())
+
+
+def _build_lines(text_dict: dict) -> list:
+    """
+    Collect the non-empty text lines of a page's text dict.
+    
+    Returns:
+        List of line dicts with the line's text, its whitespace-free
+        lowercase 'normalized' text, its non-empty spans, its bbox and a
+        'replaced' flag for the caller
+    """
+    lines = []
+    for block in text_dict.get("blocks", []):
+        if "lines" not in block:
+            continue
+        
+        for line in block.get("lines", []):
+            line_text_parts = []
+            line_spans = []
+            min_x = float('inf')
+            max_x = 0
+            min_y = float('inf')
+            max_y = 0
+            
+            for span in line.get("spans", []):
+                span_text = span.get("text", "").strip()
+                if span_text:
+                    line_text_parts.append(span_text)
+                    line_spans.append(span)
+                    
+                    # Grow the line bbox by the span bbox
+                    x0, y0, x1, y1 = span.get("bbox", [0, 0, 0, 0])
+                    if x0 < min_x:
+                        min_x = x0
+                    if x1 > max_x:
+                        max_x = x1
+                    if y0 < min_y:
+                        min_y = y0
+                    if y1 > max_y:
+                        max_y = y1
+            
+            if line_text_parts:
+                # Combine line text and normalize
+                line_text = ' '.join(line_text_parts)
+                lines.append({
+                    'text': line_text,
+                    'normalized': normalize_text(line_text).lower(),
+                    'spans': line_spans,
+                    'bbox': (min_x, min_y, max_x, max_y),
+                    'replaced': False
+                })
+    
+    return lines
+
+
+def _insert_replacement_text(page, page_num: int, new_text: str, textbox_rect, point,
+                             font_size: float, font_name: str, color: tuple,
+                             failed_fonts: set) -> bool:
+    """
+    Insert new_text where the matched line was redacted.
+    
+    Same fallback order as pdf_replace_text.py: textbox, then baseline
+    point, then FALLBACK_FONTS. Fonts that failed are added to
+    failed_fonts and skipped for later replacements.
+    
+    Returns:
+        True if the text was inserted, False otherwise
+    """
+    if font_name not in failed_fonts:
+        try:
+            chars_fit = page.insert_textbox(
+                textbox_rect,
+                new_text,
+                fontsize=font_size,
+                fontname=font_name,
+                color=color,
+                align=0
+            )
+            if chars_fit >= 0 and chars_fit >= len(new_text):
+                return True
+            # Textbox didn't work, use insert_text at baseline
+            if DEBUG:
+                print(f"DEBUG: Textbox fit {chars_fit} chars, using insert_text at baseline", file=sys.stderr)
+            page.insert_text(point, new_text, fontsize=font_size, fontname=font_name, color=color)
+            return True
+        except Exception as insert_error:
+            failed_fonts.add(font_name)
+            if DEBUG:
+                print(f"DEBUG: Insert failed: {str(insert_error)}, trying fallback fonts", file=sys.stderr)
+    
+    for fallback_font in FALLBACK_FONTS:
+        font_kwargs = {'fontname': fallback_font} if fallback_font else {}
+        try:
+            page.insert_text(point, new_text, fontsize=font_size, color=color, **font_kwargs)
+            return True
+        except Exception as fallback_error:
+            last_error = fallback_error
+            if DEBUG:
+                print(f"DEBUG: Insert with {fallback_font or 'default'} font failed: {str(fallback_error)}", file=sys.stderr)
+    
+    print(f"WARNING: Could not insert text at page {page_num + 1}: {str(last_error)}", file=sys.stderr)
+    return False
+
+
+def _find_matches(page, page_num: int, page_replacements: list) -> list:
+    """
+    Match one page's replacements to its text lines; see replace_text_at_positions().
+    
+    Only reads the page, so it can run on a worker's copy of the document.
+    
+    Returns:
+        List of matches as (line bbox, font props, new text), empty if no
+        replacement matched
+    """
+    # Get all text lines on the page with their positions, shared by
+    # all of the page's replacements
+    lines = _build_lines(page.get_text("dict", flags=TEXT_FLAGS))
+    
+    # Matched replacements as (line bbox, font props, new text)
+    matches = []
+    
+    for replacement in page_replacements:
+        old_text = replacement.get('oldText', '').strip()
+        new_text = replacement.get('newText', '').strip()
+        
+        if not old_text:
+            continue
+        
+        if DEBUG:
+            print(f"\nDEBUG: Processing replacement on page {page_num + 1}", file=sys.stderr)
+            print(f"DEBUG: oldText: '{old_text[:50]}...'", file=sys.stderr)
+            print(f"DEBUG: newText: '{new_text[:50]}...'", file=sys.stderr)
+        
+        # Normalize text for matching (case-insensitive)
+        normalized_old = normalize_text(old_text).lower()
+        
+        # Find matching text using content-based search (like pdf-redactor)
+        # Search through all text lines to find the first match
+        found_match = False
+        match_bbox = None
+        match_font_props = None
+        
+        for line_data in lines:
+            # A line already matched by an earlier replacement is taken
+            if line_data['replaced']:
+                continue
+            
+            normalized_line = line_data['normalized']
+            
+            # Check for match (exact or partial): only the shorter
+            # text can be inside the other, and an exact match is
+            # found by either containment test
+            if len(normalized_old) <= len(normalized_line):
+                is_match = normalized_old in normalized_line
+            else:
+                is_match = normalized_line in normalized_old
+            
+            if is_match:
+                
+                # Found match - use this line's bbox
+                line_spans = line_data['spans']
+                match_bbox = line_data['bbox']
+                match_font_props = {
+                    'size': line_spans[0].get("size", 12),
+                    'font': line_spans[0].get("font", "helv"),
+                    'color': line_spans[0].get("color", 0)
+                }
+                line_data['replaced'] = True
+                found_match = True
+                if DEBUG:
+                    print(f"DEBUG: Found text match: '{line_data['text'][:50]}...'", file=sys.stderr)
+                    print(f"DEBUG: Match bbox: {match_bbox}", file=sys.stderr)
+                break
+        
+        if not found_match:
+            print(f"WARNING: Could not find text '{old_text[:50]}...' on page {page_num + 1}", file=sys.stderr)
+            continue
+        
+        matches.append((match_bbox, match_font_props, new_text))
+    
+    return matches
+
+
+def _apply_matches(page, page_num: int, matches: list, failed_fonts: set) -> int:
+    """
+    Redact the matches found by _find_matches() and insert the new text.
+    
+    All matches are redacted together before any new text is inserted.
+    
+    Returns:
+        Number of replacements inserted on the page
+    """
+    replacements_made = 0
+    page_height = page.rect.height
+    
+    # One content-stream rewrite for all the page's redactions
+    for match_bbox, _, _ in matches:
+        page.add_redact_annot(fitz.Rect(*match_bbox), fill=(1, 1, 1))  # White fill
+    page.apply_redactions()
+    
+    for match_bbox, match_font_props, new_text in matches:
+        x0, y0, x1, y1 = match_bbox
+        # Insert at the redacted rectangle (converted from top-left to
+        # bottom-left origin), or failing that at its baseline
+        textbox_rect = fitz.Rect(x0, page_height - y1, x1, page_height - y0)
+        point = fitz.Point(x0, page_height - y1)
+        if DEBUG:
+            print(f"DEBUG: Inserting text at bbox: {textbox_rect}", file=sys.stderr)
+            print(f"DEBUG: Font: {match_font_props['font']}, Size: {match_font_props['size']}", file=sys.stderr)
+        if _insert_replacement_text(page, page_num, new_text, textbox_rect, point,
+                                    match_font_props['size'], match_font_props['font'],
+                                    color_from_int(match_font_props['color']), failed_fonts):
+            replacements_made += 1
+            if DEBUG:
+                print(f"DEBUG: Successfully replaced text on page {page_num + 1}", file=sys.stderr)
+    
+    return replacements_made
+
+
+def _init_replace_worker(pdf_path: str):
+    """Open the input PDF once per worker process."""
+    global _WORKER_DOC
+    _WORKER_DOC = fitz.open(pdf_path)
+
+
+def _find_matches_worker(page_num: int, page_replacements: list):
+    """
+    Match one page's replacements in the worker's document.
+    
+    Returns:
+        (page_num, list of matches from _find_matches())
+    """
+    return page_num, _find_matches(_WORKER_DOC[page_num], page_num, page_replacements)
 
 
 def replace_text_at_positions(pdf_path: str, output_path: str, replacements: list) -> bool:
@@ -34,7 +296,8 @@ def replace_text_at_positions(pdf_path: str, output_path: str, replacements: lis
     Returns:
         True if replacement successful, False otherwise
     """
-    print(f"DEBUG: Starting hybrid replace_text_at_positions with {len(replacements)} replacements", file=sys.stderr)
+    if DEBUG:
+        print(f"DEBUG: Starting hybrid replace_text_at_positions with {len(replacements)} replacements", file=sys.stderr)
     
     try:
         if not os.path.exists(pdf_path):
@@ -49,182 +312,61 @@ def replace_text_at_positions(pdf_path: str, output_path: str, replacements: lis
         doc = fitz.open(pdf_path)
         replacements_made = 0
         
-        # Process each replacement
+        # Group replacements by page so each page's text is extracted once
+        replacements_by_page = {}
         for replacement in replacements:
-            old_text = replacement.get('oldText', '').strip()
-            new_text = replacement.get('newText', '').strip()
             page_num = replacement.get('pageNum', 1) - 1  # Convert to 0-indexed
             
             if page_num < 0 or page_num >= len(doc):
                 print(f"WARNING: Invalid page number {replacement.get('pageNum')}, skipping", file=sys.stderr)
                 continue
             
-            if not old_text:
-                continue
-            
-            page = doc[page_num]
-            page_height = page.rect.height
-            
-            print(f"\nDEBUG: Processing replacement on page {page_num + 1}", file=sys.stderr)
-            print(f"DEBUG: oldText: '{old_text[:50]}...'", file=sys.stderr)
-            print(f"DEBUG: newText: '{new_text[:50]}...'", file=sys.stderr)
-            
-            # Normalize text for matching
-            normalized_old = normalize_text(old_text)
-            
-            # Get all text instances on the page with their positions
-            text_dict = page.get_text("dict")
-            
-            # Find matching text using content-based search (like pdf-redactor)
-            # Search through all text blocks to find the exact match
-            found_match = False
-            match_bbox = None
-            match_font_props = None
-            
-            for block in text_dict.get("blocks", []):
-                if "lines" not in block:
-                    continue
-                
-                for line in block.get("lines", []):
-                    line_text_parts = []
-                    line_spans = []
-                    line_bbox = None
-                    min_x = float('inf')
-                    max_x = 0
-                    min_y = float('inf')
-                    max_y = 0
-                    
-                    for span in line.get("spans", []):
-                        span_text = span.get("text", "").strip()
-                        if span_text:
-                            line_text_parts.append(span_text)
-                            line_spans.append(span)
-                            
-                            # Get span bbox
-                            bbox = span.get("bbox", [0, 0, 0, 0])
-                            x0, y0, x1, y1 = bbox
-                            min_x = min(min_x, x0)
-                            max_x = max(max_x, x1)
-                            min_y = min(min_y, y0)
-                            max_y = max(max_y, y1)
-                    
-                    if line_text_parts:
-                        # Combine line text and normalize
-                        line_text = ' '.join(line_text_parts)
-                        normalized_line = normalize_text(line_text)
-                        
-                        # Check for match (exact or partial)
-                        if (normalized_old.lower() == normalized_line.lower() or
-                            normalized_old.lower() in normalized_line.lower() or
-                            normalized_line.lower() in normalized_old.lower()):
-                            
-                            # Found match - use this line's bbox
-                            match_bbox = (min_x, min_y, max_x, max_y)
-                            match_font_props = {
-                                'size': line_spans[0].get("size", 12),
-                                'font': line_spans[0].get("font", "helv"),
-                                'color': line_spans[0].get("color", 0)
-                            }
-                            found_match = True
-                            print(f"DEBUG: Found text match: '{line_text[:50]}...'", file=sys.stderr)
-                            print(f"DEBUG: Match bbox: {match_bbox}", file=sys.stderr)
-                            break
-                    
-                    if found_match:
-                        break
-                
-                if found_match:
-                    break
-            
-            if not found_match:
-                print(f"WARNING: Could not find text '{old_text[:50]}...' on page {page_num + 1}", file=sys.stderr)
-                continue
-            
-            # Redact the matched text
-            x0, y0, x1, y1 = match_bbox
-            rect = fitz.Rect(x0, y0, x1, y1)
-            page.add_redact_annot(rect, fill=(1, 1, 1))  # White fill
-            page.apply_redactions()
-            
-            # Insert new text at the exact same position
-            # Use the redacted rectangle for insertion
-            textbox_rect = fitz.Rect(
-                x0,                           # Left
-                page_height - y1,            # Bottom (convert from top-left to bottom-left)
-                x1,                           # Right
-                page_height - y0             # Top (convert from top-left to bottom-left)
-            )
-            
-            # Parse color
-            color_int = match_font_props['color']
-            r = (color_int >> 16) & 0xFF
-            g = (color_int >> 8) & 0xFF
-            b = color_int & 0xFF
-            color = (r / 255.0, g / 255.0, b / 255.0)
-            
-            print(f"DEBUG: Inserting text at bbox: {textbox_rect}", file=sys.stderr)
-            print(f"DEBUG: Font: {match_font_props['font']}, Size: {match_font_props['size']}", file=sys.stderr)
-            
-            # Try to insert text in the exact rectangle
+            replacements_by_page.setdefault(page_num, []).append(replacement)
+        
+        page_items = sorted(replacements_by_page.items())
+        max_workers = min(os.cpu_count() or 1, MAX_REPLACE_WORKERS, len(page_items))
+        
+        # Font names that failed to insert; see _insert_replacement_text()
+        failed_fonts = set()
+        
+        # Matching runs in worker processes and the edits are applied here,
+        # as in pdf_replace_text.py's replace_text_at_positions()
+        next_item = 0
+        if max_workers > 1 and len(page_items) >= PARALLEL_MIN_PAGES:
             try:
-                chars_fit = page.insert_textbox(
-                    textbox_rect,
-                    new_text,
-                    fontsize=match_font_props['size'],
-                    fontname=match_font_props['font'],
-                    color=color,
-                    align=0
-                )
-                
-                if chars_fit < 0 or chars_fit < len(new_text):
-                    # Textbox didn't work, use insert_text at baseline
-                    print(f"DEBUG: Textbox fit {chars_fit} chars, using insert_text at baseline", file=sys.stderr)
-                    baseline_y = page_height - y1
-                    point = fitz.Point(x0, baseline_y)
-                    page.insert_text(
-                        point,
-                        new_text,
-                        fontsize=match_font_props['size'],
-                        fontname=match_font_props['font'],
-                        color=color
-                    )
-            except Exception as e:
-                # Fallback to standard font
-                try:
-                    print(f"DEBUG: Insert failed: {str(e)}, trying with 'helv' font", file=sys.stderr)
-                    baseline_y = page_height - y1
-                    point = fitz.Point(x0, baseline_y)
-                    page.insert_text(
-                        point,
-                        new_text,
-                        fontsize=match_font_props['size'],
-                        fontname="helv",
-                        color=color
-                    )
-                except Exception as e2:
-                    # Last resort: default font
-                    try:
-                        print(f"DEBUG: Insert with 'helv' failed: {str(e2)}, trying default font", file=sys.stderr)
-                        baseline_y = page_height - y1
-                        point = fitz.Point(x0, baseline_y)
-                        page.insert_text(
-                            point,
-                            new_text,
-                            fontsize=match_font_props['size'],
-                            color=color
-                        )
-                    except Exception as e3:
-                        print(f"ERROR: Could not insert text: {str(e3)}", file=sys.stderr)
-                        continue
-            
-            replacements_made += 1
-            print(f"DEBUG: Successfully replaced text on page {page_num + 1}", file=sys.stderr)
+                with ProcessPoolExecutor(
+                    max_workers=max_workers,
+                    initializer=_init_replace_worker,
+                    initargs=(pdf_path,),
+                ) as executor:
+                    futures = [
+                        executor.submit(_find_matches_worker, page_num, page_replacements)
+                        for page_num, page_replacements in page_items
+                    ]
+                    for item_num, future in enumerate(futures):
+                        page_num, matches = future.result()
+                        if matches:
+                            replacements_made += _apply_matches(doc[page_num], page_num, matches,
+                                                                failed_fonts)
+                        next_item = item_num + 1
+            except BrokenProcessPool as pool_error:
+                print(f"WARNING: Worker pool failed, replacing the remaining pages sequentially: {pool_error}", file=sys.stderr)
+        
+        # Process each (remaining) page
+        for page_num, page_replacements in page_items[next_item:]:
+            page = doc[page_num]
+            matches = _find_matches(page, page_num, page_replacements)
+            if matches:
+                replacements_made += _apply_matches(page, page_num, matches, failed_fonts)
         
         # Report summary
-        print(f"\nDEBUG: Total replacements made: {replacements_made} out of {len(replacements)} requested", file=sys.stderr)
+        if DEBUG:
+            print(f"\nDEBUG: Total replacements made: {replacements_made} out of {len(replacements)} requested", file=sys.stderr)
         
-        # Save the modified PDF
-        doc.save(output_path)
+        # Save the modified PDF. Garbage collection drops the content streams
+        # that apply_redactions() replaced (which still hold the old text) and
+        # merges duplicate objects; deflate compresses the new streams
+        doc.save(output_path, garbage=3, deflate=True)
         doc.close()
         
         return True
@@ -237,17 +379,18 @@ def replace_text_at_positions(pdf_path: str, output_path: str, replacements: lis
 
 
 if __name__ == '__main__':
-    print("="*70, file=sys.stderr)
-    print("DEBUG: pdf_replace_text_hybrid.py STARTED", file=sys.stderr)
-    print(f"DEBUG: Arguments received: {len(sys.argv)}", file=sys.stderr)
-    for i, arg in enumerate(sys.argv):
-        if i > 0 and i < len(sys.argv) - 1:
-            if arg == '--json' and i + 1 < len(sys.argv):
-                print(f"  arg[{i}]: {arg}", file=sys.stderr)
-                print(f"  arg[{i+1}]: (JSON data, {len(sys.argv[i+1])} chars)", file=sys.stderr)
-            else:
-                print(f"  arg[{i}]: {arg[:100]}..." if len(arg) > 100 else f"  arg[{i}]: {arg}", file=sys.stderr)
-    print("="*70, file=sys.stderr)
+    if DEBUG:
+        print("="*70, file=sys.stderr)
+        print("DEBUG: pdf_replace_text_hybrid.py STARTED", file=sys.stderr)
+        print(f"DEBUG: Arguments received: {len(sys.argv)}", file=sys.stderr)
+        for i, arg in enumerate(sys.argv):
+            if i > 0 and i < len(sys.argv) - 1:
+                if arg == '--json' and i + 1 < len(sys.argv):
+                    print(f"  arg[{i}]: {arg}", file=sys.stderr)
+                    print(f"  arg[{i+1}]: (JSON data, {len(sys.argv[i+1])} chars)", file=sys.stderr)
+                else:
+                    print(f"  arg[{i}]: {arg[:100]}..." if len(arg) > 100 else f"  arg[{i}]: {arg}", file=sys.stderr)
+        print("="*70, file=sys.stderr)
     
     if len(sys.argv) < 3:
         print("Usage: python pdf_replace_text_hybrid.py <input_pdf> <output_pdf> --json <replacements_json>", file=sys.stderr)
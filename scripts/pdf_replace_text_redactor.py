@@ -8,6 +8,7 @@ import sys
 import os
 import re
 import json
+from functools import lru_cache
 
 try:
     import pdf_redactor
@@ -15,6 +16,26 @@ except ImportError:
     print("ERROR: pdf-redactor library not installed. Install it with: pip install pdf-redactor", file=sys.stderr)
     sys.exit(1)
 
+# Per-replacement progress and per-match messages are only written when
+# PDF_REPLACE_DEBUG is set, as in pdf_replace_text.py
+DEBUG = os.environ.get('PDF_REPLACE_DEBUG', '').lower() in ('1', 'true', 'yes')
+
+# Runs of whitespace, collapsed to a single space in replacement text
+WHITESPACE_RE = re.compile(r'\s+')
+
+
+@lru_cache(maxsize=256)
+def _compile_flexible(old_text: str, flags: int):
+    """
+    Compile old_text into a pattern where each run of whitespace matches any
+    run of whitespace (PDFs may encode spaces as newlines, tabs, etc.).
+    
+    Cached, so a search text that appears in several replacements is only
+    escaped and compiled once.
+    """
+    # Escape each word's special regex characters and join the words with \s+
+    return re.compile(r'\s+'.join(map(re.escape, old_text.split())), flags)
+
 
 def replace_text_at_positions(pdf_path: str, output_path: str, replacements: list) -> bool:
     try:
@@ -40,40 +61,25 @@ def replace_text_at_positions(pdf_path: str, output_path: str, replacements: lis
                 print(f"WARNING: Replacement {idx + 1} has empty oldText, skipping", file=sys.stderr)
                 continue
             
-            print(f"Processing replacement {idx + 1}:", file=sys.stderr)
-            print(f"  oldText length: {len(old_text)} chars", file=sys.stderr)
-            print(f"  oldText preview: {repr(old_text[:100])}...", file=sys.stderr)
-            print(f"  newText preview: {repr(new_text[:100])}...", file=sys.stderr)
-            
-            # Normalize text: remove ALL whitespace for comparison
-            def normalize_text(text):
-                return re.sub(r'\s+', '', text.strip())
+            if DEBUG:
+                print(f"Processing replacement {idx + 1}:", file=sys.stderr)
+                print(f"  oldText length: {len(old_text)} chars", file=sys.stderr)
+                print(f"  oldText preview: {repr(old_text[:100])}...", file=sys.stderr)
+                print(f"  newText preview: {repr(new_text[:100])}...", file=sys.stderr)
             
             # For very long text (paragraphs), we need a more flexible approach
             # The issue is that PDFs may encode text differently (spaces, newlines, etc.)
             # Strategy: Create a pattern that allows flexible whitespace matching
-            
-            # First, try to escape special regex characters
-            escaped_old_text = re.escape(old_text)
-            
-            # Replace escaped spaces with flexible whitespace pattern
-            # This allows spaces, newlines, tabs, etc. to match
-            # Use \s+ to match one or more whitespace characters
-            flexible_pattern = re.sub(r'\\ ', r'\\s+', escaped_old_text)
-            
-            # For very long text, also try a more aggressive pattern that allows
-            # optional whitespace between words (but this might be too permissive)
-            # Let's start with the simpler approach
-            
             try:
                 # Use DOTALL to allow . to match newlines, and IGNORECASE for case-insensitive
-                pattern = re.compile(flexible_pattern, re.IGNORECASE | re.DOTALL)
-                print(f"  Pattern compiled successfully (length: {len(flexible_pattern)} chars)", file=sys.stderr)
+                pattern = _compile_flexible(old_text, re.IGNORECASE | re.DOTALL)
+                if DEBUG:
+                    print(f"  Pattern compiled successfully (length: {len(pattern.pattern)} chars)", file=sys.stderr)
             except Exception as e:
                 print(f"  ERROR: Failed to compile flexible pattern: {e}", file=sys.stderr)
                 print(f"  Falling back to exact pattern", file=sys.stderr)
                 try:
-                    pattern = re.compile(escaped_old_text, re.IGNORECASE)
+                    pattern = re.compile(re.escape(old_text), re.IGNORECASE)
                 except Exception as e2:
                     print(f"  ERROR: Failed to compile exact pattern: {e2}", file=sys.stderr)
                     print(f"  Skipping this replacement", file=sys.stderr)
@@ -83,12 +89,14 @@ def replace_text_at_positions(pdf_path: str, output_path: str, replacements: lis
             match_tracker = {'found': False, 'count': 0}
             
             def make_replacement_func(replacement_text, tracker):
+                # Normalize spacing once: collapse multiple spaces/newlines to single space
+                normalized = WHITESPACE_RE.sub(' ', replacement_text.strip())
+                
                 def replacement_func(match):
                     tracker['found'] = True
                     tracker['count'] += 1
-                    # Normalize spacing: collapse multiple spaces/newlines to single space
-                    normalized = re.sub(r'\s+', ' ', replacement_text.strip())
-                    print(f"  → MATCH #{tracker['count']} FOUND! Applying replacement", file=sys.stderr)
+                    if DEBUG:
+                        print(f"  → MATCH #{tracker['count']} FOUND! Applying replacement", file=sys.stderr)
                     return normalized
                 return replacement_func
             
@@ -99,7 +107,8 @@ def replace_text_at_positions(pdf_path: str, output_path: str, replacements: lis
             if not hasattr(replace_text_at_positions, '_match_trackers'):
                 replace_text_at_positions._match_trackers = []
             replace_text_at_positions._match_trackers.append(match_tracker)
-            print(f"  ✓ Pattern created and added to filters", file=sys.stderr)
+            if DEBUG:
+                print(f"  ✓ Pattern created and added to filters", file=sys.stderr)
         
         if not content_filters:
             print("ERROR: No valid replacements to process", file=sys.stderr)
@@ -109,12 +118,14 @@ def replace_text_at_positions(pdf_path: str, output_path: str, replacements: lis
         
         options.content_filters = content_filters
         
-        print(f"\nTotal filters to apply: {len(content_filters)}", file=sys.stderr)
-        print("Starting redaction process...", file=sys.stderr)
+        if DEBUG:
+            print(f"\nTotal filters to apply: {len(content_filters)}", file=sys.stderr)
+            print("Starting redaction process...", file=sys.stderr)
         
         try:
             pdf_redactor.redactor(options)
-            print("✓ Redaction completed successfully", file=sys.stderr)
+            if DEBUG:
+                print("✓ Redaction completed successfully", file=sys.stderr)
             
             # Report match results
             if hasattr(replace_text_at_positions, '_match_trackers') and replace_text_at_positions._match_trackers:
@@ -139,9 +150,8 @@ def replace_text_at_positions(pdf_path: str, output_path: str, replacements: lis
             print("ERROR: Output file was not created", file=sys.stderr)
             return False
         
-        # Check output file size
-        output_size = os.path.getsize(output_path)
-        print(f"Output file created: {output_size} bytes", file=sys.stderr)
+        if DEBUG:
+            print(f"Output file created: {os.path.getsize(output_path)} bytes", file=sys.stderr)
         
         return True
         
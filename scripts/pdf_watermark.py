@@ -23,6 +23,84 @@ def hex_to_rgb(hex_color: str) -> tuple:
     return (128, 128, 128)  # Default gray
 
 
+def render_rotated_text(watermark_text: str, font_size: float, final_color: tuple,
+                        opacity: float, rotation: float) -> tuple:
+    """
+    Render the watermark text into a rotated transparent PNG.
+    
+    Args:
+        watermark_text: Text to use as watermark
+        font_size: Font size for watermark
+        final_color: RGB color in 0-1 range (already blended for opacity)
+        opacity: Opacity (0.0 to 1.0)
+        rotation: Rotation in degrees
+        
+    Returns:
+        (png_bytes, width, height) of the rotated image
+    """
+    from PIL import Image, ImageDraw, ImageFont
+    import io
+    
+    # Create image with text
+    # Estimate text size
+    text_width_approx = len(watermark_text) * font_size * 0.6
+    img_width = int(text_width_approx * 1.5)
+    img_height = int(font_size * 2)
+    
+    # Create white background image
+    img = Image.new('RGBA', (img_width, img_height), (255, 255, 255, 0))
+    draw = ImageDraw.Draw(img)
+    
+    # Convert color
+    img_color = tuple(int(c * 255) for c in final_color)
+    # Add alpha based on opacity
+    if opacity < 1.0:
+        img_color = img_color + (int(opacity * 255),)
+    else:
+        img_color = img_color + (255,)
+    
+    # Draw text (try to use default font, fallback to basic)
+    try:
+        # Try to use a truetype font if available
+        font_obj = ImageFont.truetype("arial.ttf", int(font_size))
+    except:
+        try:
+            font_obj = ImageFont.load_default()
+        except:
+            font_obj = None
+    
+    # Get text bounding box
+    if font_obj:
+        bbox = draw.textbbox((0, 0), watermark_text, font=font_obj)
+        text_w = bbox[2] - bbox[0]
+        text_h = bbox[3] - bbox[1]
+    else:
+        text_w = len(watermark_text) * font_size * 0.6
+        text_h = font_size
+    
+    # Center text in image
+    text_x_img = (img_width - text_w) / 2
+    text_y_img = (img_height - text_h) / 2
+    
+    # Draw text
+    if font_obj:
+        draw.text((text_x_img, text_y_img), watermark_text, fill=img_color, font=font_obj)
+    else:
+        draw.text((text_x_img, text_y_img), watermark_text, fill=img_color)
+    
+    # Rotate image
+    rotated_img = img.rotate(rotation, expand=True, fillcolor=(255, 255, 255, 0))
+    
+    # Convert to bytes
+    img_bytes_io = io.BytesIO()
+    rotated_img.save(img_bytes_io, format='PNG')
+    img_bytes = img_bytes_io.getvalue()
+    img_bytes_io.close()
+    
+    rot_width, rot_height = rotated_img.size
+    return img_bytes, rot_width, rot_height
+
+
 def add_watermark(pdf_path: str, output_path: str, watermark_text: str, 
                   font_size: float, opacity: float, position: str, 
                   color: str = '#808080') -> bool:
@@ -54,6 +132,42 @@ def add_watermark(pdf_path: str, output_path: str, watermark_text: str,
         # Normalize to 0-1 range for PyMuPDF
         color_normalized = (rgb_color[0] / 255.0, rgb_color[1] / 255.0, rgb_color[2] / 255.0)
         
+        # Everything below up to the page loop is the same for every page, so it
+        # is worked out once rather than per page
+        
+        # Determine rotation
+        rotation = 0 if position == 'center' else -45  # -45 degrees for diagonal
+        
+        # For opacity, adjust color (blend with white background)
+        if opacity < 1.0:
+            # Adjust color based on opacity (blend with white background)
+            adjusted_color = tuple(
+                min(255, int(c * 255 * opacity + 255 * (1 - opacity))) 
+                for c in color_normalized
+            )
+            # Normalize back
+            final_color = tuple(c / 255.0 for c in adjusted_color)
+        else:
+            final_color = color_normalized
+        
+        # Approximate text width for centering
+        text_width_approx = len(watermark_text) * font_size * 0.6
+        
+        # With rotation - use PIL/Pillow to create the rotated text image once
+        rotated_image = None
+        if rotation != 0:
+            try:
+                rotated_image = render_rotated_text(watermark_text, font_size, final_color, opacity, rotation)
+            except ImportError:
+                # PIL not available - fallback to simple text
+                print("WARNING: PIL/Pillow not available, using simple text without rotation", file=sys.stderr)
+            except Exception as e:
+                # Any other error - fallback
+                print(f"WARNING: Rotated watermark failed, using simple text: {str(e)}", file=sys.stderr)
+        
+        # The rotated image is embedded once and every later page references it
+        image_xref = 0
+        
         # Process each page
         for page_num in range(len(doc)):
             page = doc[page_num]
@@ -63,27 +177,10 @@ def add_watermark(pdf_path: str, output_path: str, watermark_text: str,
             center_x = page_rect.width / 2
             center_y = page_rect.height / 2
             
-            # Determine rotation
-            rotation = 0 if position == 'center' else -45  # -45 degrees for diagonal
-            
-            # For opacity, adjust color (blend with white background)
-            if opacity < 1.0:
-                # Adjust color based on opacity (blend with white background)
-                adjusted_color = tuple(
-                    min(255, int(c * 255 * opacity + 255 * (1 - opacity))) 
-                    for c in color_normalized
-                )
-                # Normalize back
-                final_color = tuple(c / 255.0 for c in adjusted_color)
-            else:
-                final_color = color_normalized
-            
             # Use page.insert_textbox for better control, or use shape with standard font
             # PyMuPDF uses bottom-left origin, so adjust center_y
             center_y_from_bottom = page_rect.height - center_y
             
-            # Approximate text width for centering
-            text_width_approx = len(watermark_text) * font_size * 0.6
             text_x = center_x - (text_width_approx / 2)
             
             # Use insert_textbox for better font handling and rotation support
@@ -118,69 +215,10 @@ def add_watermark(pdf_path: str, output_path: str, watermark_text: str,
                         fontsize=font_size,
                         color=final_color
                     )
-            else:
-                # With rotation - use PIL/Pillow to create rotated text image
+            elif rotated_image is not None:
+                img_bytes, rot_width, rot_height = rotated_image
                 try:
-                    from PIL import Image, ImageDraw, ImageFont
-                    import io
-                    
-                    # Create image with text
-                    # Estimate text size
-                    img_width = int(text_width_approx * 1.5)
-                    img_height = int(font_size * 2)
-                    
-                    # Create white background image
-                    img = Image.new('RGBA', (img_width, img_height), (255, 255, 255, 0))
-                    draw = ImageDraw.Draw(img)
-                    
-                    # Convert color
-                    img_color = tuple(int(c * 255) for c in final_color)
-                    # Add alpha based on opacity
-                    if opacity < 1.0:
-                        img_color = img_color + (int(opacity * 255),)
-                    else:
-                        img_color = img_color + (255,)
-                    
-                    # Draw text (try to use default font, fallback to basic)
-                    try:
-                        # Try to use a truetype font if available
-                        font_obj = ImageFont.truetype("arial.ttf", int(font_size))
-                    except:
-                        try:
-                            font_obj = ImageFont.load_default()
-                        except:
-                            font_obj = None
-                    
-                    # Get text bounding box
-                    if font_obj:
-                        bbox = draw.textbbox((0, 0), watermark_text, font=font_obj)
-                        text_w = bbox[2] - bbox[0]
-                        text_h = bbox[3] - bbox[1]
-                    else:
-                        text_w = len(watermark_text) * font_size * 0.6
-                        text_h = font_size
-                    
-                    # Center text in image
-                    text_x_img = (img_width - text_w) / 2
-                    text_y_img = (img_height - text_h) / 2
-                    
-                    # Draw text
-                    if font_obj:
-                        draw.text((text_x_img, text_y_img), watermark_text, fill=img_color, font=font_obj)
-                    else:
-                        draw.text((text_x_img, text_y_img), watermark_text, fill=img_color)
-                    
-                    # Rotate image
-                    rotated_img = img.rotate(rotation, expand=True, fillcolor=(255, 255, 255, 0))
-                    
-                    # Convert to bytes
-                    img_bytes_io = io.BytesIO()
-                    rotated_img.save(img_bytes_io, format='PNG')
-                    img_bytes = img_bytes_io.getvalue()
-                    img_bytes_io.close()
-                    
                     # Calculate rotated image dimensions
-                    rot_width, rot_height = rotated_img.size
                     rot_w = rot_width / 2.0  # Adjust scale if needed
                     rot_h = rot_height / 2.0
                     
@@ -193,17 +231,11 @@ def add_watermark(pdf_path: str, output_path: str, watermark_text: str,
                     )
                     
                     # Insert rotated image
-                    page.insert_image(img_rect, stream=img_bytes)
+                    if image_xref:
+                        page.insert_image(img_rect, xref=image_xref)
+                    else:
+                        image_xref = page.insert_image(img_rect, stream=img_bytes)
                     
-                except ImportError:
-                    # PIL not available - fallback to simple text
-                    print("WARNING: PIL/Pillow not available, using simple text without rotation", file=sys.stderr)
-                    page.insert_text(
-                        fitz.Point(text_x, center_y_from_bottom),
-                        watermark_text,
-                        fontsize=font_size,
-                        color=final_color
-                    )
                 except Exception as e:
                     # Any other error - fallback
                     print(f"WARNING: Rotated watermark failed, using simple text: {str(e)}", file=sys.stderr)
@@ -213,6 +245,14 @@ def add_watermark(pdf_path: str, output_path: str, watermark_text: str,
                         fontsize=font_size,
                         color=final_color
                     )
+            else:
+                # Rotated image could not be rendered - simple text
+                page.insert_text(
+                    fitz.Point(text_x, center_y_from_bottom),
+                    watermark_text,
+                    fontsize=font_size,
+                    color=final_color
+                )
         
         # Save the watermarked PDF
         doc.save(output_path)
@@ -0,0 +1,91 @@
+import { test, expect } from '@playwright/test';
+import { PDFDocument, StandardFonts } from 'pdf-lib';
+import { execFileSync, spawnSync } from 'child_process';
+import * as fs from 'fs';
+import * as path from 'path';
+
+// Runs scripts/pdf_replace_text.py directly: its position-based mode is not
+// reachable through the UI, so these tests don't need a browser page
+const SCRIPT = path.join(__dirname, '../../scripts/pdf_replace_text.py');
+
+function findPython(): string | null {
+  for (const cmd of ['python3', 'python']) {
+    try {
+      execFileSync(cmd, ['-c', 'import fitz, rapidfuzz'], { stdio: 'ignore' });
+      return cmd;
+    } catch (e) {}
+  }
+  return null;
+}
+
+function pageText(python: string, pdfPath: string): string {
+  return execFileSync(python, [
+    '-c',
+    'import sys, fitz; print(fitz.open(sys.argv[1])[0].get_text())',
+    pdfPath,
+  ]).toString();
+}
+
+test.describe('Replace Text Script Tests', () => {
+  let testPDF: string;
+  let python: string | null;
+
+  test.beforeAll(async () => {
+    const testDataDir = path.join(__dirname, '../test-data');
+    if (!fs.existsSync(testDataDir)) {
+      fs.mkdirSync(testDataDir, { recursive: true });
+    }
+
+    const pdf = await PDFDocument.create();
+    const font = await pdf.embedFont(StandardFonts.Helvetica);
+    const page = pdf.addPage([612, 792]);
+    page.drawText('Invoice Number 1001', { x: 72, y: 692, size: 12, font });
+    page.drawText('Customer Alice', { x: 72, y: 652, size: 12, font });
+    // Two separate words on the same line
+    page.drawText('Left', { x: 72, y: 612, size: 12, font });
+    page.drawText('Right', { x: 300, y: 612, size: 12, font });
+    page.drawText('Total Due 42', { x: 72, y: 572, size: 12, font });
+    const pdfBytes = await pdf.save();
+    testPDF = path.join(testDataDir, 'replace-text-test.pdf');
+    fs.writeFileSync(testPDF, pdfBytes);
+
+    python = findPython();
+  });
+
+  test('should apply every edit on a page, including two on the same line', async () => {
+    if (!python) {
+      // PyMuPDF or rapidfuzz is not installed where the tests run
+      test.skip();
+      return;
+    }
+
+    // Coordinates are top-left based; with pageWidth/pageHeight equal to the
+    // PDF page size they are used as points unchanged
+    const edit = (oldText: string, newText: string, x: number, y: number) => ({
+      oldText, newText, pageNum: 1, x, y, pageWidth: 612, pageHeight: 792,
+    });
+    const replacements = [
+      edit('Invoice Number 1001', 'Invoice Number 2002', 72, 95),
+      edit('Customer Alice', 'Customer Bob', 72, 135),
+      edit('Left', 'West', 80, 175),
+      edit('Right', 'East', 310, 175),
+      edit('Total Due 42', 'Total Due 99', 72, 215),
+      // Matches the same text as the edit above: the first edit wins and
+      // this one is skipped with a warning
+      edit('Total Due 42', 'Total Due 77', 72, 215),
+    ];
+
+    const outputPath = path.join(path.dirname(testPDF), 'replace-text-output.pdf');
+    const result = spawnSync(python, [SCRIPT, testPDF, outputPath, '--json', JSON.stringify(replacements)]);
+    expect(result.status).toBe(0);
+    expect(result.stderr.toString()).toContain('already being replaced, skipping duplicate');
+
+    const text = pageText(python, outputPath);
+    for (const newText of ['Invoice Number 2002', 'Customer Bob', 'West', 'East', 'Total Due 99']) {
+      expect(text).toContain(newText);
+    }
+    for (const oldText of ['1001', 'Alice', 'Left', 'Right', 'Total Due 42', 'Total Due 77']) {
+      expect(text).not.toContain(oldText);
+    }
+  });
+});